@@ -0,0 +1,60 @@
+# Copyright 2016 Thingswise, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Connection pooling benchmark.
+
+Sends the same sequence of QAPI requests to a local stub server with a new
+connection per request (module-level `requests.get`, as before pooling) and
+through a `ConnectionPool`, and reports the request rates, e.g.:
+
+  python benchmarks/connection_pool.py --requests 2000
+"""
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+import stub
+from twml import ConnectionPool
+
+def run(get, base, n):
+    t = time.time()
+    for i in xrange(n):
+        r = get("%s/qapi/timeseries/A%d" % (base, i % 100),
+                params={"from": 0, "to": 600, "period": "1min"})
+        r.raise_for_status()
+        r.json()
+    return n / (time.time() - t)
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--requests", type="int", default=2000,
+                      help="the number of requests to send")
+    options, _ = parser.parse_args()
+
+    base = stub.start()
+    pool = ConnectionPool()
+    try:
+        before = run(requests.get, base, options.requests)
+        after = run(pool.get, base, options.requests)
+    finally:
+        pool.close()
+    print "new connection per request: %7.0f req/s" % before
+    print "ConnectionPool:             %7.0f req/s (x%.2f)" % (after, after / before)
+
+if __name__ == "__main__":
+    main()
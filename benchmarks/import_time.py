@@ -0,0 +1,69 @@
+# Copyright 2016 Thingswise, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Cold `import twml` benchmark.
+
+Imports the package in fresh interpreters and reports the best import time.
+Exits with status 1 if it exceeds the threshold, or if the import loads
+NumPy or runs versioneer (which may shell out to git), e.g.:
+
+  python benchmarks/import_time.py --max-ms 20
+"""
+import os
+import sys
+import subprocess
+from optparse import OptionParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import sys, time
+t = time.time()
+import twml
+t = time.time() - t
+print("%f %d %d" % (t * 1000, "numpy" in sys.modules, "subprocess" in sys.modules))
+"""
+
+def measure(python):
+    out = subprocess.check_output([python, "-c", PROBE], cwd=ROOT)
+    ms, numpy, subproc = out.split()
+    return float(ms), numpy == "1", subproc == "1"
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--max-ms", type="float", default=20.0,
+                      help="the maximum allowed import time (ms)")
+    parser.add_option("--runs", type="int", default=10,
+                      help="the number of fresh interpreters to import in")
+    parser.add_option("--python", default=sys.executable,
+                      help="the interpreter to benchmark")
+    options, _ = parser.parse_args()
+
+    results = [ measure(options.python) for _ in xrange(options.runs) ]
+    best = min(ms for ms, _, _ in results)
+    print "import twml: best %.2f ms of %d runs (limit %.2f ms)" % (best, options.runs, options.max_ms)
+    failed = False
+    if best > options.max_ms:
+        print "FAIL: import time regressed"
+        failed = True
+    if any(numpy for _, numpy, _ in results):
+        print "FAIL: import twml loads NumPy"
+        failed = True
+    if any(subproc for _, _, subproc in results):
+        print "FAIL: import twml loads subprocess (versioneer)"
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
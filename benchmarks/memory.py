@@ -0,0 +1,83 @@
+# Copyright 2016 Thingswise, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Memory footprint benchmark for `DataPoint` and `Vector`.
+
+Reports the size of a single object (including its attribute dictionary,
+if any) and the resident memory per point of a list of `DataPoint`s built
+in a fresh interpreter, for the current classes and for the former ones
+without `__slots__`, e.g.:
+
+  python benchmarks/memory.py --points 2000000
+"""
+import os
+import sys
+import resource
+import subprocess
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from twml.data_query import DataPoint, Vector
+
+class LegacyDataPoint:
+
+    def __init__(self, ts, value):
+        self.ts = ts
+        self.value = value
+
+class LegacyVector:
+
+    def __init__(self, key, coordinates):
+        self.key = key
+        self.coordinates = coordinates
+
+CLASSES = {
+    "former": (LegacyDataPoint, LegacyVector),
+    "current": (DataPoint, Vector),
+}
+
+def size(obj):
+    return sys.getsizeof(obj) + (sys.getsizeof(obj.__dict__) if hasattr(obj, "__dict__") else 0)
+
+def points(kind, n):
+    """Build the points in this interpreter and print the resident memory
+    growth per point (bytes)
+    """
+    cls = CLASSES[kind][0]
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ps = [ cls(1500000000 + i, float(i)) for i in xrange(n) ]
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print (after - before) * 1024.0 / len(ps)
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--points", type="int", default=2000000,
+                      help="the number of points to build")
+    parser.add_option("--build", help="build the points of the given kind (internal)")
+    options, _ = parser.parse_args()
+
+    if options.build:
+        points(options.build, options.points)
+        return
+
+    for kind in ("former", "current"):
+        point, vector = CLASSES[kind]
+        rss = float(subprocess.check_output([sys.executable, __file__,
+                                             "--build", kind, "--points", str(options.points)]))
+        print "%-7s DataPoint %3d bytes, Vector %3d bytes, %d points: %.0f bytes/point resident" % (
+            kind, size(point(1500000000, 1.5)), size(vector("k", {})), options.points, rss)
+
+if __name__ == "__main__":
+    main()
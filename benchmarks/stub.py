@@ -0,0 +1,96 @@
+# Copyright 2016 Thingswise, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+A local stub of the QAPI and Jets endpoints for the benchmarks.
+
+QAPI timeseries queries (`/qapi/timeseries/<query>`) return one point per
+minute of the requested interval; Jets queries (`/jets`) return one record
+per device, for a GET with `deviceId` as well as for a bulk POST.
+"""
+import json
+import time
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+def points(query, _from, _to, step=60):
+    out = []
+    h = sum(ord(c) for c in query)
+    s = (_from + step - 1) // step * step
+    while s < _to:
+        out.append({"name": str(s), "value": {
+            "avg": float((s // step + h) % 7), "sum": float((s // step) % 7 + h % 3),
+            "cnt": (s // step + h) % 4, "stddev": 0.5, "min": float(-(s % 5)), "max": float(s % 11)}})
+        s += step
+    return out
+
+def record(device_id):
+    return {"deviceId": device_id, "site": "site%d" % (sum(ord(c) for c in device_id) % 3)}
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    delay = 0
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, obj, code=200):
+        body = json.dumps(obj)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.delay:
+            time.sleep(self.delay)
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        if url.path.startswith("/qapi/timeseries/"):
+            query = urlparse.unquote(url.path[len("/qapi/timeseries/"):])
+            self.send(points(query, int(params["from"]), int(params["to"])))
+        elif url.path == "/jets":
+            self.send([record(params["deviceId"])])
+        else:
+            self.send({}, 404)
+
+    def do_POST(self):
+        if self.delay:
+            time.sleep(self.delay)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if urlparse.urlparse(self.path).path == "/jets":
+            self.send([record(d) for d in json.loads(body)])
+        else:
+            self.send({}, 404)
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def start(delay=0):
+    """Start the stub on a free local port in a background thread and return
+    its base URL
+    """
+    class DelayedHandler(Handler):
+        pass
+    DelayedHandler.delay = delay
+    server = Server(("127.0.0.1", 0), DelayedHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return "http://127.0.0.1:%d" % server.server_address[1]
@@ -0,0 +1,76 @@
+# Copyright 2016 Thingswise, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Template rendering benchmark.
+
+Renders a template for 10^6 contexts with the former concatenating
+`KeyDef.apply`, with `Template.__call__` and with `Template.render_many`,
+and checks that the results are the same, e.g.:
+
+  python benchmarks/template.py --renders 1000000
+"""
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from twml import Template
+
+TEMPLATE = "A for {deviceId}|{site} by 1min"
+
+def legacy_apply(d, r):
+    """The rendering before the templates were compiled
+    """
+    result = ""
+    for i in range(len(d)):
+        if i % 2 == 0:
+            s = d[i]
+        else:
+            s = r(d[i])
+        if type(s) == unicode:
+            s = s.encode("utf-8")
+        else:
+            s = str(s)
+        result += s
+    return result
+
+def timed(f):
+    t = time.time()
+    result = f()
+    return time.time() - t, result
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--renders", type="int", default=1000000,
+                      help="the number of contexts to render the template for")
+    options, _ = parser.parse_args()
+
+    contexts = [ { "deviceId": "dev-%d" % i, "site": "site-%d" % (i % 50) } for i in xrange(options.renders) ]
+    template = Template(TEMPLATE)
+    d = template.keyDef.d
+
+    t_legacy, expected = timed(lambda: [ legacy_apply(d, lambda k: ctx[k]) for ctx in contexts ])
+    t_call, result = timed(lambda: [ template(ctx) for ctx in contexts ])
+    assert result == expected
+    t_many, result = timed(lambda: template.render_many(contexts))
+    assert result == expected
+    print "%d renders of %r:" % (options.renders, TEMPLATE)
+    print "  former KeyDef.apply    %6.2f s" % t_legacy
+    print "  Template.__call__      %6.2f s" % t_call
+    print "  Template.render_many   %6.2f s" % t_many
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Copyright 2016 Thingswise, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Sliding window benchmark for `TimeseriesFeatureCoordinateExtractor`.
+
+Extracts the number of points of every window (window 60 s, step 10 s) from
+series of 10^4 to 10^6 points, stored as a `Timeseries` and as a list of
+`DataPoint`s, and compares it with the former implementation which scanned
+the whole series for every window (only run up to `--legacy-max` points,
+since it is quadratic), e.g.:
+
+  python benchmarks/windows.py --legacy-max 100000
+"""
+import os
+import sys
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from twml import TimeseriesFeatureCoordinateExtractor
+from twml.data_query import Timeseries, Vector
+
+class LegacyExtractor(TimeseriesFeatureCoordinateExtractor):
+    """The windowing before binary search: one pass over the series per window
+    """
+    def __call__(self, src):
+        ts = sorted(src.timeseries(self.coord), key=lambda x: x.ts)
+        l = len(ts)
+        if l > 0:
+            end = ts[-1].ts + 1
+            start = ts[0].ts
+            S = (end - start - self.window) // self.step + 1
+            for i in xrange(0, S):
+                q = end - i*self.step
+                p = end - i*self.step - self.window
+                sub = [ v for v in ts if v.ts >= p and v.ts < q ]
+                yield self.extract(sub)
+
+def series(n):
+    rs = np.random.RandomState(0)
+    ts = np.cumsum(rs.randint(0, 2, n) + rs.randint(0, 2, n)).astype(np.int64)
+    return Timeseries(ts, rs.rand(n))
+
+def run(extractor, vector):
+    t = time.time()
+    result = [ x["n"] for x in extractor(vector) ]
+    return time.time() - t, result
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--legacy-max", type="int", default=10000,
+                      help="the longest series to run the former implementation on")
+    options, _ = parser.parse_args()
+
+    coordExtractor = { "n": len }
+    extractor = TimeseriesFeatureCoordinateExtractor(60, 10, "a", coordExtractor)
+    legacy = LegacyExtractor(60, 10, "a", coordExtractor)
+    for n in (10**4, 10**5, 10**6):
+        ts = series(n)
+        columnar = Vector("a", { "a": ts })
+        points = Vector("a", { "a": list(ts) })
+        t_array, expected = run(extractor, columnar)
+        t_list, result = run(extractor, points)
+        assert result == expected
+        line = "%8d points: Timeseries %7.3f s, list %7.3f s" % (n, t_array, t_list)
+        if n <= options.legacy_max:
+            t_legacy, result = run(legacy, points)
+            assert result == expected
+            line += ", former %8.3f s" % t_legacy
+        print line
+
+if __name__ == "__main__":
+    main()
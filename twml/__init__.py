@@ -12,19 +12,74 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from ._version import get_versions
-__version__ = get_versions()['version']
-#del get_versions
+# The public names are loaded on first access, so that importing the package
+# neither imports NumPy nor runs versioneer (which may shell out to git)
+import sys
+from types import ModuleType
 
-from metadata_query import MetadataQuery
-from template import Template
-from data_query import DataQuery
-from model_helper import Filter, AndFilter,\
-                         HasCoord, TimeseriesFeatureExtractor, TimeseriesFeatureCoordinateExtractor,\
-                         OnTimeExtractor, StopsExtractor, Extract, Progress, ModelHelper, Scale, \
-                         Sum, TimeseriesCollectionFeatureExtractor, TimeseriesCollectionFeatureCoordinateExtractor, \
-                         diag_vect, matrix, stack, VectorList
-from models import Model, Scatter, KMeansModel, KMeansModelFactory                          
-from ._version import get_versions
-__version__ = get_versions()['version']
-del get_versions
+_exports = {
+    "ConnectionPool": "connection",
+    "DiskCache": "cache",
+    "MetadataCache": "cache",
+    "MetadataQuery": "metadata_query",
+    "Record": "metadata_query",
+    "Template": "template",
+    "DataQuery": "data_query",
+    "Filter": "model_helper",
+    "AndFilter": "model_helper",
+    "OrFilter": "model_helper",
+    "NotFilter": "model_helper",
+    "Compare": "model_helper",
+    "Coord": "model_helper",
+    "HasCoord": "model_helper",
+    "TimeseriesFeatureExtractor": "model_helper",
+    "TimeseriesFeatureCoordinateExtractor": "model_helper",
+    "OnTimeExtractor": "model_helper",
+    "StopsExtractor": "model_helper",
+    "Extract": "model_helper",
+    "FeatureMatrix": "model_helper",
+    "Progress": "model_helper",
+    "ModelHelper": "model_helper",
+    "Scale": "model_helper",
+    "Sum": "model_helper",
+    "Count": "model_helper",
+    "Mean": "model_helper",
+    "Variance": "model_helper",
+    "Min": "model_helper",
+    "Max": "model_helper",
+    "TimeseriesCollectionFeatureExtractor": "model_helper",
+    "TimeseriesCollectionFeatureCoordinateExtractor": "model_helper",
+    "diag_vect": "model_helper",
+    "matrix": "model_helper",
+    "stack": "model_helper",
+    "VectorList": "model_helper",
+    "Model": "models",
+    "Scatter": "models",
+    "KMeansModel": "models",
+    "KMeansModelFactory": "models"
+}
+
+__all__ = sorted(_exports)
+
+class _Package(ModuleType):
+
+    def __getattr__(self, name):
+        if name == "__version__":
+            from ._version import get_versions
+            value = get_versions()['version']
+        elif name in _exports:
+            __import__("%s.%s" % (__name__, _exports[name]))
+            value = getattr(sys.modules["%s.%s" % (__name__, _exports[name])], name)
+        else:
+            raise AttributeError("'module' object has no attribute '%s'" % name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_exports) | set(["__version__"]))
+
+_package = _Package(__name__, __doc__)
+_package.__dict__.update(sys.modules[__name__].__dict__)
+# Keep the original module alive, its globals are used by _Package
+_package._module = sys.modules[__name__]
+sys.modules[__name__] = _package
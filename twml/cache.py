@@ -0,0 +1,201 @@
+# Copyright 2016 Thingswise, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import time
+import hashlib
+import tempfile
+import threading
+import cPickle as pickle
+from collections import OrderedDict
+
+class DiskCache:
+    """A size-bounded on-disk cache of query responses.
+
+    Every entry is stored in a separate file which is written under a
+    temporary name and then renamed into place, so several processes can
+    share the same cache directory: a reader either sees a complete entry
+    or no entry at all. When the total size of the entries exceeds
+    `max_size` the least recently used ones are removed.
+
+    Attributes:
+        path        The cache directory
+        max_size    The maximum total size of the cached entries (bytes)
+        ttl         The time to live (seconds) of entries which may still
+                    change, e.g. the ones touching the current time
+    """
+    SUFFIX = ".entry"
+
+    def __init__(self, path, max_size=1 << 30, ttl=60):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._written = None
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha1(repr(parts)).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + DiskCache.SUFFIX)
+
+    def get(self, key):
+        """Return the cached value or `None` if there is no valid entry for
+        the key
+        """
+        f = self._file(key)
+        try:
+            with open(f, "rb") as fd:
+                expires, value = pickle.load(fd)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires is not None and expires <= time.time():
+            self._remove(f)
+            return None
+        try:
+            os.utime(f, None)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value, ttl=None):
+        """Store the value. If `ttl` is `None` the entry never expires (but
+        can still be evicted)
+        """
+        expires = time.time() + ttl if ttl is not None else None
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+            size = os.path.getsize(tmp)
+            os.rename(tmp, self._file(key))
+        except:
+            self._remove(tmp)
+            raise
+        if self._written is None or self._written + size > self.max_size // 10:
+            self._written = 0
+            self.evict()
+        else:
+            self._written += size
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits into
+        `max_size`
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            if not name.endswith(DiskCache.SUFFIX):
+                continue
+            f = os.path.join(self.path, name)
+            try:
+                st = os.stat(f)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+            total += st.st_size
+        if total <= self.max_size:
+            return
+        entries.sort()
+        for _, size, f in entries:
+            self._remove(f)
+            total -= size
+            if total <= self.max_size:
+                break
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith(DiskCache.SUFFIX):
+                self._remove(os.path.join(self.path, name))
+
+    @staticmethod
+    def _remove(f):
+        try:
+            os.remove(f)
+        except OSError:
+            pass
+
+class MetadataCache:
+    """A size-bounded in-memory cache of device metadata records, optionally
+    backed by a :code:`DiskCache`.
+
+    The entries are keyed by the Jets URL and the device ID and expire `ttl`
+    seconds after they were stored. When there are more than `max_entries`
+    entries in memory the least recently used ones are removed. Entries
+    missing in memory are looked up in `disk`, if given, so they survive
+    the process.
+
+    Attributes:
+        max_entries The maximum number of entries kept in memory
+        ttl         The time to live (seconds) of an entry
+        disk        The :code:`DiskCache` backing the cache, or `None`
+        hits        The number of lookups answered from the cache
+        misses      The number of lookups not answered from the cache
+    """
+    def __init__(self, max_entries=100000, ttl=3600, disk=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, jets_url, device_id):
+        """Return the cached records of the device or `None` if there is no
+        valid entry for it
+        """
+        key = (jets_url, device_id)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[0] > now:
+                self._entries[key] = entry
+                self.hits += 1
+                return entry[1]
+        if self.disk is not None:
+            entry = self.disk.get(DiskCache.key("metadata", jets_url, device_id))
+            if entry is not None and entry[0] > now:
+                with self._lock:
+                    self._store(key, entry)
+                    self.hits += 1
+                return entry[1]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, jets_url, device_id, records):
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._store((jets_url, device_id), (expires, records))
+        if self.disk is not None:
+            self.disk.put(DiskCache.key("metadata", jets_url, device_id),
+                (expires, records), self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _store(self, key, entry):
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,95 @@
+# Copyright 2016 Thingswise, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import threading
+
+_default = None
+_default_lock = threading.Lock()
+
+class ConnectionPool:
+    """A pool of keep-alive HTTP connections shared by the query objects.
+
+    Every QAPI and Jets request made through the same pool reuses the
+    already established TCP (and TLS) connections instead of opening a new
+    one per request. A process forked after the pool was used starts with a
+    new session rather than sharing the pooled connections of its parent.
+
+    Attributes:
+        pool_connections    The number of per-host connection pools to keep
+        pool_maxsize        The maximum number of connections kept open to a
+                            single host
+        pool_block          Whether to block (instead of opening an extra
+                            throw-away connection) when all connections to
+                            a host are in use
+        max_retries         The number of retries for failed connections
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, max_retries=0):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.max_retries = max_retries
+        self._session = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @staticmethod
+    def default():
+        """Return the process-wide pool used by queries which were not given
+        an explicit one
+        """
+        global _default
+        with _default_lock:
+            if _default is None:
+                _default = ConnectionPool()
+            return _default
+
+    def _after_fork(self):
+        if self._pid != os.getpid():
+            # The session (and the lock, which might have been held by
+            # another thread) was inherited from the parent process. Its
+            # sockets are shared with the parent, so leave them alone
+            self._lock = threading.Lock()
+            self._session = None
+            self._pid = os.getpid()
+
+    @property
+    def session(self):
+        self._after_fork()
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                for prefix in ("http://", "https://"):
+                    session.mount(prefix, HTTPAdapter(
+                        pool_connections=self.pool_connections,
+                        pool_maxsize=self.pool_maxsize,
+                        pool_block=self.pool_block,
+                        max_retries=self.max_retries))
+                self._session = session
+            return self._session
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        self._after_fork()
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
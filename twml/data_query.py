@@ -12,22 +12,162 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from __future__ import division
+from executor import executor as make_executor, imap_ordered, CoalescingExecutor, Prefetch
+from metadata_query import project
 
-class DataPoint:
+PERIOD_UNITS = {
+    "s": 1,
+    "sec": 1,
+    "min": 60,
+    "h": 3600,
+    "hour": 3600,
+    "d": 86400,
+    "day": 86400,
+    "w": 604800,
+    "week": 604800
+}
+
+def period_seconds(period):
+    """Convert a period specification such as `1min` or `15s` into seconds
+    """
+    i = 0
+    while i < len(period) and period[i].isdigit():
+        i += 1
+    try:
+        return int(period[:i] or 1) * PERIOD_UNITS[period[i:].strip()]
+    except KeyError:
+        raise ValueError("Unsupported period: %s" % period)
+
+AGGREGATIONS = {
+    "avg": lambda v: v["sum"] / v["cnt"] if v["cnt"] > 0 else 0,
+    "val": lambda v: v["sum"] / v["cnt"] if v["cnt"] > 0 else 0,
+    "sum": lambda v: v["sum"],
+    "stddev": lambda v: v["stddev"],
+    "min": lambda v: v["min"],
+    "max": lambda v: v["max"],
+    "cnt": lambda v: v["cnt"]
+}
+
+ALL_AGGREGATIONS = [ "avg", "sum", "cnt", "stddev", "min", "max" ]
+
+class DataPoint(object):
+    __slots__ = ("ts", "value")
 
     def __init__(self, ts, value):
         self.ts = ts
         self.value = value
 
+    def __reduce__(self):
+        return (DataPoint, (self.ts, self.value))
+
     def __repr__(self):
         return "(%d, %.2f)" % (self.ts, self.value)
 
-class Vector:
+class Timeseries:
+    """Array-backed timeseries.
+
+    Iterating over a timeseries or indexing it with an integer produces
+    `DataPoint` objects, so it can be used wherever a list of `DataPoint`s
+    is expected. Slicing it produces another `Timeseries` sharing the same
+    arrays.
+
+    Attributes:
+        ts          int64 array of timestamps (seconds since Unix Epoch)
+        value       float64 array of values
+    """
+    def __init__(self, ts, value):
+        self.ts = ts
+        self.value = value
+
+    def __len__(self):
+        return len(self.ts)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return Timeseries(self.ts[i], self.value[i])
+        return DataPoint(int(self.ts[i]), float(self.value[i]))
+
+    def __iter__(self):
+        for ts, value in zip(self.ts.tolist(), self.value.tolist()):
+            yield DataPoint(ts, value)
+
+    def __repr__(self):
+        return "[%s]" % ", ".join(repr(p) for p in self)
+
+    def sorted(self):
+        """Return the timeseries sorted by timestamp, retaining the order of
+        points with equal timestamps
+        """
+        import numpy as np
+
+        if len(self.ts) < 2 or (self.ts[1:] >= self.ts[:-1]).all():
+            return self
+        order = np.argsort(self.ts, kind="mergesort")
+        return Timeseries(self.ts[order], self.value[order])
+
+    def buckets(self, start, step, n):
+        """Group the points into `n` consecutive subintervals of length `step`
+        beginning at `start`. Returns a `(timeseries, lo, hi)` tuple where
+        the timeseries holds the points ordered by subinterval (retaining
+        their original order within a subinterval) and `lo` and `hi` are the
+        arrays of the subinterval index boundaries in it.
+        """
+        import numpy as np
+
+        ts, value = self.ts, self.value
+        if len(ts) > 1 and (ts[1:] < ts[:-1]).any():
+            idx = (ts - start) // step
+            order = np.argsort(idx, kind="mergesort")
+            ts, value = ts[order], value[order]
+            pos = np.searchsorted(idx[order], np.arange(n + 1))
+        else:
+            pos = np.searchsorted(ts, start + np.arange(n + 1, dtype=np.int64) * step)
+        return Timeseries(ts, value), pos[:-1], pos[1:]
+
+    def split(self, start, step, n):
+        """Split the timeseries into `n` consecutive subintervals of length
+        `step` beginning at `start`. Returns the list of the corresponding
+        sub-timeseries, the original order of the points is retained.
+        """
+        timeseries, lo, hi = self.buckets(start, step, n)
+        return [ timeseries[i:j] for i, j in zip(lo.tolist(), hi.tolist()) ]
+
+def as_timeseries(timeseries):
+    """Return the timeseries (e.g. a list of `DataPoint`s) as a `Timeseries`
+    """
+    if isinstance(timeseries, Timeseries):
+        return timeseries
+    import numpy as np
+
+    timeseries = list(timeseries)
+    return Timeseries(np.fromiter((p.ts for p in timeseries), np.int64, len(timeseries)),
+                      np.fromiter((p.value for p in timeseries), np.float64, len(timeseries)))
+
+def split_timeseries(timeseries, start, step, n):
+    """Split a timeseries into `n` consecutive subintervals of length `step`
+    beginning at `start` in a single pass. Returns the list of the
+    corresponding sub-timeseries, the original order of the points is
+    retained.
+    """
+    if isinstance(timeseries, Timeseries):
+        return timeseries.split(start, step, n)
+    buckets = [ [] for i in xrange(n) ]
+    for p in timeseries:
+        i = (p.ts - start) // step
+        if i >= 0 and i < n:
+            buckets[i].append(p)
+    return buckets
+
+class Vector(object):
+    __slots__ = ("key", "coordinates")
 
     def __init__(self, key, coordinates):
         self.key = key
         self.coordinates = coordinates
 
+    def __reduce__(self):
+        return (Vector, (self.key, self.coordinates))
+
     def __repr__(self):
         return "Vector(key=%s, coordinates=%s)" % (self.key, self.coordinates)
 
@@ -37,7 +177,10 @@ class Vector:
 class DataQuery:
 
     def __init__(self, qapi_url, templates, period, interval, _from, _to, key,
-            input_data=[], input_data_len=0, split=None, progress=None, aggregation="avg"):
+            input_data=[], input_data_len=0, split=None, progress=None, aggregation="avg",
+            connection_pool=None, max_in_flight=1, wide=False, max_points=None, cache=None,
+            columnar=True, coalesce=0, key_fields=None, compact=False,
+            prefetch=0):
         self.qapi_url = qapi_url
         self.templates = templates
         self.period = period
@@ -50,20 +193,55 @@ class DataQuery:
         self.split = split
         self.progress = progress
         self.aggregation = aggregation
+        self.connection_pool = connection_pool
+        self.max_in_flight = max_in_flight
+        self.wide = wide
+        self.max_points = max_points
+        self.cache = cache
+        self.columnar = columnar
+        self.coalesce = coalesce
+        self.key_fields = key_fields
+        self.compact = compact
+        self.prefetch = prefetch
+
+    def fields(self):
+        """Return the metadata fields used by the templates and `key`, which
+        reads `key_fields`
+        """
+        fields = []
+        for template_key in self.templates:
+            template = self.templates[template_key]
+            if not hasattr(template, "fields"):
+                raise ValueError("Cannot determine the fields used by template: %s" % template_key)
+            fields.extend(template.fields())
+        fields.extend(self.key_fields or [])
+        return sorted(set(fields))
+
+    def _input(self):
+        if self.key_fields is None:
+            return self.input_data.get() if hasattr(self.input_data, "get") else self.input_data
+        fields = self.fields()
+        if hasattr(self.input_data, "get"):
+            return self.input_data.get(fields=fields, compact=self.compact)
+        return (project(d, fields, self.compact) for d in self.input_data)
 
     def get(self):
-        import requests
         import time
+        from connection import ConnectionPool
+
+        pool = self.connection_pool or ConnectionPool.default()
 
         #print "%.2f" % time.time()
 
+        now = int(time.time())
+
         if self._from <= 0:
-            _from = int(time.time()) + self._from
+            _from = now + self._from
         else:
             _from = self._from
 
         if self._to <= 0:
-            _to = int(time.time()) + self._to
+            _to = now + self._to
         else:
             _to = self._to
 
@@ -74,67 +252,152 @@ class DataQuery:
         if self.interval <= 0:
             raise ValueError("Invalid interval")
 
-        total = self.input_data_len * (time_span // self.interval) * len(self.templates)
+        for aggregation in self._aggregations():
+            if aggregation not in AGGREGATIONS:
+                raise ValueError("Unsupported aggregation: %s" % aggregation)
+
+        starts = range(_to - self.interval, _from - 1, -self.interval)
+        if self.wide:
+            chunk = len(starts)
+            if self.max_points:
+                chunk = max(1, self.max_points * period_seconds(self.period) // self.interval)
+        else:
+            chunk = 1
+        chunks = [ starts[i:i+chunk] for i in xrange(0, len(starts), chunk) ]
+
+        total = self.input_data_len * len(chunks) * len(self.templates)
         cnt = 0
 
-        for d in self.input_data.get() if hasattr(self.input_data, "get") else self.input_data:
-            start = _to - self.interval
-            while start >= _from:
-                end = start + self.interval
+        def tasks():
+            for d in source:
+                for c in chunks:
+                    start = c[-1]
+                    end = c[0] + self.interval
+                    for template_key in self.templates:
+                        template = self.templates[template_key]
+                        url = "%s/timeseries/%s" % (self.qapi_url, template(d))
+                        yield d, c, start, end, template_key, url
 
-                coordinates = {}
-                for template_key in self.templates:
-                    template = self.templates[template_key]
-                    url = "%s/timeseries/%s" % (self.qapi_url, template(d))
-                    r = requests.get(
-                        url,
-                        params={
-                            "from": start,
-                            "to": end,
-                            "period": self.period
-                        })
-                    if r.status_code != 200:
-                        raise ValueError("Data Query returned error: %d" % r.status_code)
-                    cnt += 1
-                    if self.progress:
-                        self.progress(cnt, total)
-                    timeseries = []
-                    for p in r.json():
-                        ts = int(p["name"])
-                        _sum = p["value"]["sum"]
-                        _cnt = p["value"]["cnt"]
-                        _stddev = p["value"]["stddev"]
-                        _max = p["value"]["max"]
-                        _min = p["value"]["min"]
-                        if self.aggregation == "avg" or self.aggregation == "val":                            
-                            if _cnt > 0:
-                                _avg = _sum / _cnt
-                                timeseries.append(DataPoint(ts, _avg))
-                            else:
-                                timeseries.append(DataPoint(ts, 0))
-                        elif self.aggregation == "sum":
-                            timeseries.append(DataPoint(ts, _sum))
-                        elif self.aggregation == "stddev":
-                            timeseries.append(DataPoint(ts, _stddev))
-                        elif self.aggregation == "min":
-                            timeseries.append(DataPoint(ts, _min))
-                        elif self.aggregation == "max":
-                            timeseries.append(DataPoint(ts, _max))
-                        elif self.aggregation == "cnt":
-                            timeseries.append(DataPoint(ts, _cnt))
-                        else:
-                            raise ValueError("Unsupported aggregation: %s" + self.aggregation)                            
-                            
-                    coordinates[template_key] = timeseries
-
-                if self.split is None:
-                    vector = Vector(key="%s:%d" % (self.key(d), start), coordinates=coordinates)
-                    yield vector
-                    start = start - self.interval
+        def fetch(d, c, start, end, template_key, url):
+            if self.cache is not None:
+                key = self.cache.key(url, start, end, self.period)
+                points = self.cache.get(key)
+                if points is not None:
+                    return self._timeseries(points)
+            r = pool.get(
+                url,
+                params={
+                    "from": start,
+                    "to": end,
+                    "period": self.period
+                })
+            if r.status_code != 200:
+                raise ValueError("Data Query returned error: %d" % r.status_code)
+            points = r.json()
+            if self.cache is not None:
+                # Closed intervals never change, the ones touching the
+                # current time may still receive data
+                if self._from <= 0 or self._to <= 0 or end > now:
+                    self.cache.put(key, points, self.cache.ttl)
+                else:
+                    self.cache.put(key, points)
+            return self._timeseries(points)
+
+        executor = make_executor(self.max_in_flight)
+        if self.coalesce:
+            executor = CoalescingExecutor(executor,
+                                          lambda d, c, start, end, template_key, url: (url, start, end),
+                                          max(self.coalesce, self.max_in_flight))
+        source = self._input()
+        if self.prefetch:
+            # Obtain the input data (e.g. run the metadata queries) while
+            # the data queries of the preceding elements are in progress
+            source = Prefetch(source, self.prefetch)
+
+        try:
+            coordinates = {}
+            received = 0
+            for (d, c, start, end, template_key, url), timeseries in \
+                    imap_ordered(executor, fetch, tasks(), self.max_in_flight):
+                cnt += 1
+                if self.progress:
+                    self.progress(cnt, total)
+                for name, t in zip(self._coordinates(template_key), timeseries):
+                    if self.coalesce and not self.columnar:
+                        # The result may be shared with other vectors, give
+                        # every one its own points
+                        t = [ DataPoint(p.ts, p.value) for p in t ]
+                    coordinates[name] = t
+                received += 1
+                if received < len(self.templates):
+                    continue
+
+                if len(c) == 1:
+                    for vector in self._vectors(d, start, coordinates):
+                        yield vector
                 else:
-                    for template_key in coordinates:
-                        for p in self.split(coordinates[template_key]):
-                            vector = Vector(key="%s:%d:%s" % (self.key(d), start, template_key),
-                                            coordinates={template_key: p})
+                    buckets = { k: split_timeseries(coordinates[k], start, self.interval, len(c)) for k in coordinates }
+                    for i in xrange(len(c) - 1, -1, -1):
+                        sub = { k: buckets[k][i] for k in buckets }
+                        for vector in self._vectors(d, start + i * self.interval, sub):
                             yield vector
-                    start = start - self.interval
\ No newline at end of file
+                coordinates = {}
+                received = 0
+        finally:
+            executor.close()
+            if self.prefetch:
+                source.close()
+
+
+    def _aggregations(self):
+        if self.aggregation == "all":
+            return ALL_AGGREGATIONS
+        if isinstance(self.aggregation, basestring):
+            return [ self.aggregation ]
+        return list(self.aggregation)
+
+    def _coordinates(self, template_key):
+        """Return the names of the coordinates produced by a template, one
+        for every requested aggregation
+        """
+        if isinstance(self.aggregation, basestring) and self.aggregation != "all":
+            return [ template_key ]
+        return [ "%s:%s" % (template_key, a) for a in self._aggregations() ]
+
+    def _timeseries(self, points):
+        """Decode a QAPI response into a list of timeseries, one for every
+        requested aggregation
+        """
+        functions = [ AGGREGATIONS[a] for a in self._aggregations() ]
+
+        ts = []
+        values = [ [] for f in functions ]
+        if len(functions) == 1:
+            f = functions[0]
+            value = values[0]
+            for p in points:
+                ts.append(int(p["name"]))
+                value.append(f(p["value"]))
+        else:
+            for p in points:
+                ts.append(int(p["name"]))
+                v = p["value"]
+                for value, f in zip(values, functions):
+                    value.append(f(v))
+
+        if not self.columnar:
+            return [ [ DataPoint(t, x) for t, x in zip(ts, value) ] for value in values ]
+
+        import numpy as np
+
+        ts = np.array(ts, dtype=np.int64)
+        return [ Timeseries(ts, np.array(value, dtype=np.float64)) for value in values ]
+
+    def _vectors(self, d, start, coordinates):
+        if self.split is None:
+            yield Vector(key="%s:%d" % (self.key(d), start), coordinates=coordinates)
+        else:
+            for template_key in coordinates:
+                for p in self.split(coordinates[template_key]):
+                    yield Vector(key="%s:%d:%s" % (self.key(d), start, template_key),
+                                 coordinates={template_key: p})
@@ -0,0 +1,167 @@
+# Copyright 2016 Thingswise, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import sys
+import threading
+from collections import deque, OrderedDict
+from Queue import Queue, Empty, Full
+
+class _Deferred:
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.done = False
+
+    def get(self):
+        if not self.done:
+            self.value = self.fn(*self.args)
+            self.done = True
+        return self.value
+
+class SerialExecutor:
+    """Executor that runs every task in the calling thread at the moment its
+    result is requested
+    """
+    def submit(self, fn, *args):
+        return _Deferred(fn, args)
+
+    def close(self):
+        pass
+
+class ThreadExecutor:
+    """Executor that runs tasks on a pool of worker threads
+    """
+    def __init__(self, max_workers):
+        from multiprocessing.pool import ThreadPool
+
+        self.pool = ThreadPool(max_workers)
+
+    def submit(self, fn, *args):
+        return self.pool.apply_async(fn, args)
+
+    def close(self):
+        self.pool.terminate()
+
+class CoalescingExecutor:
+    """Executor wrapper which runs tasks with the same key only once.
+
+    A task submitted while another one with the same key is pending, or has
+    recently completed, shares its result. The results of the last
+    `max_entries` distinct keys are retained.
+    """
+    def __init__(self, executor, key, max_entries=256):
+        self.executor = executor
+        self.key = key
+        self.max_entries = max_entries
+        self.results = OrderedDict()
+
+    def submit(self, fn, *args):
+        k = self.key(*args)
+        try:
+            result = self.results.pop(k)
+        except KeyError:
+            result = self.executor.submit(fn, *args)
+        self.results[k] = result
+        if len(self.results) > self.max_entries:
+            self.results.popitem(last=False)
+        return result
+
+    def close(self):
+        self.results.clear()
+        self.executor.close()
+
+def executor(max_in_flight):
+    """Return an executor suitable for running at most `max_in_flight` tasks
+    at a time
+    """
+    if max_in_flight is None or max_in_flight <= 1:
+        return SerialExecutor()
+    return ThreadExecutor(max_in_flight)
+
+def imap_ordered(executor, fn, tasks, max_in_flight):
+    """Apply `fn` to every argument tuple in `tasks` and yield `(task, result)`
+    pairs in the order of `tasks`.
+
+    At most `max_in_flight` tasks are submitted to the executor at any moment,
+    and `tasks` is consumed no further ahead than that.
+    """
+    max_in_flight = max(1, max_in_flight or 1)
+    pending = deque()
+    for task in tasks:
+        pending.append((task, executor.submit(fn, *task)))
+        if len(pending) >= max_in_flight:
+            task, result = pending.popleft()
+            yield task, result.get()
+    while pending:
+        task, result = pending.popleft()
+        yield task, result.get()
+
+class Prefetch:
+    """Iterator over `iterable` which is consumed on a background thread.
+
+    At most `size` items are obtained ahead of the consumer; when they are
+    not taken the background thread waits. An exception raised by
+    `iterable` is re-raised to the consumer in place of the next item.
+    `close()` stops the background thread (and closes `iterable`, if it is
+    a generator) without waiting for the remaining items.
+    """
+    _ITEM, _END, _ERROR = range(3)
+
+    def __init__(self, iterable, size):
+        self.iterable = iterable
+        self.queue = Queue(max(1, size))
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        try:
+            for item in self.iterable:
+                if not self._put((Prefetch._ITEM, item)):
+                    break
+            else:
+                self._put((Prefetch._END, None))
+        except BaseException:
+            self._put((Prefetch._ERROR, sys.exc_info()))
+        finally:
+            if hasattr(self.iterable, "close"):
+                self.iterable.close()
+
+    def _put(self, entry):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(entry, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def __iter__(self):
+        while not self.stopped.is_set():
+            kind, value = self.queue.get()
+            if kind != Prefetch._ITEM:
+                self.stopped.set()
+                if kind == Prefetch._ERROR:
+                    raise value[0], value[1], value[2]
+                return
+            yield value
+
+    def close(self):
+        self.stopped.set()
+        try:
+            while True:
+                self.queue.get_nowait()
+        except Empty:
+            pass
@@ -11,39 +11,196 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from executor import executor as make_executor, imap_ordered
+
+# Field name -> position maps shared by the records with the same fields
+_indices = {}
+
+def _index(fields):
+    try:
+        return _indices[fields]
+    except KeyError:
+        return _indices.setdefault(fields, dict((f, i) for i, f in enumerate(fields)))
+
+def _record(fields, values):
+    return Record(_index(fields), values)
+
+class Record(object):
+    """A compact read-only metadata record.
+
+    The values are kept in a tuple, while the mapping of the field names to
+    their positions is shared by all records with the same fields. A record
+    can be used instead of a dictionary in templates and `key` functions.
+    """
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, index, values):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, name):
+        return self._values[self._index[name]]
+
+    def get(self, name, default=None):
+        i = self._index.get(name)
+        return default if i is None else self._values[i]
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def keys(self):
+        return sorted(self._index, key=self._index.get)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        return isinstance(other, Record) and dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def items(self):
+        return zip(self.keys(), self._values)
+
+    def __reduce__(self):
+        return (_record, (tuple(self.keys()), self._values))
+
+    def __repr__(self):
+        return "Record(%s)" % ", ".join("%s=%r" % kv for kv in self.items())
+
+def project(record, fields, compact=False):
+    """Return a copy of the metadata record with only the given fields (the
+    ones missing in the record are skipped). If `compact` is set the copy is
+    a :code:`Record` rather than a dictionary
+    """
+    present = tuple(f for f in fields if f in record)
+    if compact:
+        return Record(_index(present), tuple(record[f] for f in present))
+    return dict((f, record[f]) for f in present)
+
 class MetadataQuery:
 
-    def __init__(self, jets_url, input_data=[], progress=None):
+    def __init__(self, jets_url, input_data=[], progress=None, connection_pool=None,
+            max_in_flight=1, bulk=None, cache=None, fields=None, compact=False,
+            batch_size=30):
         self.jets_url = jets_url
         self.progress = progress
         self.input_data = input_data
+        self.connection_pool = connection_pool
+        self.max_in_flight = max_in_flight
+        self.bulk = bulk
+        self.cache = cache
+        self.fields = fields
+        self.compact = compact
+        self.batch_size = batch_size
 
-    def get(self, batch_size=30):
-        import requests
+    def get(self, batch_size=None, fields=None, compact=None):
+        from connection import ConnectionPool
+
+        pool = self.connection_pool or ConnectionPool.default()
 
         cnt = 0
-        batch_size = 1 # Override batch size for now
-        batch = []
-        for d in self.input_data:
-            batch.append(d)
-            if len(batch) >= batch_size:
-                # r = requests.post(self.jets_url, json=batch)
-                r = requests.get(self.jets_url, params={ "deviceId": batch[0] })
-                batch = []
-                if r.status_code != 200:
+        if batch_size is None:
+            batch_size = self.batch_size
+        batch_size = max(1, batch_size or 1)
+        if fields is None:
+            fields = self.fields
+        if compact is None:
+            compact = self.compact
+
+        def batches():
+            batch = []
+            for d in self.input_data:
+                batch.append(d)
+                if len(batch) >= batch_size or self.bulk is False:
+                    yield (batch,)
+                    batch = []
+            if len(batch) > 0:
+                yield (batch,)
+
+        def fetch_one(d):
+            r = pool.get(self.jets_url, params={ "deviceId": d })
+            if r.status_code != 200:
+                raise ValueError("Metadata Query returned error: %d" % r.status_code)
+            return r.json()
+
+        def fetch_each(batch):
+            # The batch is already running on the executor, so the devices
+            # are queried one after another to keep within max_in_flight.
+            # After a fallback the next batches consist of single devices
+            return dict((d, fetch_one(d)) for d in batch)
+
+        def fetch(batch):
+            found = {}
+            missing = []
+            for d in batch:
+                if d not in found:
+                    found[d] = self.cache.get(self.jets_url, d) if self.cache is not None else None
+                    if found[d] is None:
+                        missing.append(d)
+            if len(missing) > 1 and self.bulk is not False:
+                fetched = fetch_bulk(missing)
+            else:
+                fetched = fetch_each(missing)
+            found.update(fetched)
+            if self.cache is not None:
+                for d in fetched:
+                    self.cache.put(self.jets_url, d, fetched[d])
+            records = []
+            for d in batch:
+                records.extend(found[d] or [])
+            if fields is not None:
+                # Project the records before they are queued, so the unused
+                # fields are released right away
+                records = [project(v, fields, compact) for v in records]
+            return records
+
+        def fetch_bulk(batch):
+            # The bulk response is not guaranteed to follow the order of the
+            # batch, so the records are grouped by device. The devices
+            # without any records are left out
+            r = pool.post(self.jets_url, json=batch)
+            records = None
+            if r.status_code == 200:
+                try:
+                    records = r.json()
+                except ValueError:
+                    if self.bulk:
+                        raise
+            if not isinstance(records, list):
+                if self.bulk:
                     raise ValueError("Metadata Query returned error: %d" % r.status_code)
-                for v in r.json():
+                # Until a bulk query succeeds, any other answer is taken to
+                # mean the endpoint does not support them
+                self.bulk = False
+                return fetch_each(batch)
+            # The device IDs of the batch rather than the decoded ones
+            # (e.g. unicode) are the keys of the result
+            wanted = dict((d, d) for d in batch)
+            fetched = {}
+            for v in records:
+                d = wanted.get(v.get("deviceId")) if isinstance(v, dict) else None
+                if d is None:
+                    # The records cannot be attributed to the devices
+                    # (e.g. the endpoint reports the IDs in another
+                    # form), so they could be neither ordered nor cached
+                    self.bulk = False
+                    return fetch_each(batch)
+                fetched.setdefault(d, []).append(v)
+            self.bulk = True
+            return fetched
+
+        executor = make_executor(self.max_in_flight)
+        try:
+            for _, records in imap_ordered(executor, fetch, batches(), self.max_in_flight):
+                for v in records:
                     cnt += 1
                     if self.progress:
                         self.progress(cnt, len(self.input_data))
                     yield v
-        if len(batch) > 0:
-            # r = requests.post(self.jets_url, json=batch)
-            r = requests.get(self.jets_url, params={ "deviceId": batch[0] })
-            if r.status_code != 200:
-                raise ValueError("Metadata Query returned error: %d" % r.status_code)
-            for v in r.json():
-                cnt += 1
-                if self.progress:
-                    self.progress(cnt, len(self.input_data))
-                yield v
\ No newline at end of file
+        finally:
+            executor.close()
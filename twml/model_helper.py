@@ -12,24 +12,233 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import inspect
+import operator
 import numpy as np
+from bisect import bisect_left
+from collections import deque
+from itertools import chain, islice, repeat
+from data_query import Timeseries, split_timeseries, as_timeseries
+
+def sort_timeseries(ts):
+    """Return the timeseries sorted by timestamp. An already sorted
+    `Timeseries` is returned as is.
+    """
+    if isinstance(ts, Timeseries):
+        return ts.sorted()
+    return sorted(ts, key=lambda x: x.ts)
+
+def timestamps(ts):
+    """Return the timestamps of the timeseries as a list or an array
+    """
+    if isinstance(ts, Timeseries):
+        return ts.ts
+    return [ v.ts for v in ts ]
+
+def batched(extractor):
+    """Check whether the extractor can compute the values for all the
+    windows of a timeseries at once.
+
+    Such extractors provide the `batch(ts, value, lo, hi)` method which gets
+    the timestamp and value arrays of the whole timeseries and the arrays of
+    the window index boundaries, and returns the array of the values, one
+    for every window. Other extractors are called for every window
+    separately, and so are the extractors which replace the `__call__` of
+    the class providing their `batch`, since `batch` would not compute what
+    they do.
+    """
+    name = "_batch" if isinstance(extractor, _Batched) else "batch"
+    if not hasattr(extractor, name):
+        return False
+    if hasattr(extractor, "__call__"):
+        base = [ c for c in inspect.getmro(extractor.__class__) if name in c.__dict__ ][0]
+        if _overrides(extractor, base, "__call__"):
+            return False
+    if isinstance(extractor, Scale):
+        return batched(extractor.ext)
+    return True
+
+def _prefix(w):
+    return np.concatenate(([0], np.cumsum(w)))
+
+def _pair_sums(c, lo, hi):
+    """Return the sums of `w[i]`, the values attributed to the pairs of
+    consecutive points `(i, i+1)`, over the pairs within every window, given
+    the prefix sums `c` of `w`
+    """
+    n = len(c) - 1
+    return c[np.minimum(np.maximum(hi - 1, lo), n)] - c[np.minimum(lo, n)]
+
+class _Arrays:
+    """The arrays of a timeseries together with the arrays derived from them,
+    which are computed once and shared by the extractors
+    """
+    def __init__(self, ts, value):
+        self.ts = ts
+        self.value = value
+        self.derived = {}
+
+    def get(self, name, f):
+        try:
+            return self.derived[name]
+        except KeyError:
+            self.derived[name] = f(self)
+            return self.derived[name]
+
+    @property
+    def on(self):
+        return self.get("on", lambda a: (a.value > 0).astype(np.int64))
+
+    @property
+    def cumsum(self):
+        return self.get("cumsum", lambda a: _prefix(a.value))
+
+class _Batched:
+
+    def batch(self, ts, value, lo, hi):
+        return self._batch(_Arrays(ts, value), lo, hi)
+
+def _signature(extractor):
+    """Return a key identifying what the extractor computes, so that equal
+    extractors (e.g. several `Sum()` instances) are evaluated once
+    """
+    if isinstance(extractor, Scale):
+        return ("scale", extractor.scale, _signature(extractor.ext))
+    if extractor.__class__ in _STATELESS:
+        return (extractor.__class__,)
+    return ("id", id(extractor))
+
+class _ExtractionPlan:
+    """Evaluation plan of a set of named extractors applied to the windows
+    of one timeseries.
+
+    The batched extractors are evaluated for all the windows at once, and
+    the work they have in common is only done once: equal extractors (such
+    as `Sum()` under several `Scale`s) are computed once, and so are the
+    arrays derived from the timeseries (the prefix sums, the thresholded
+    signal, etc.) which are shared by different extractors.
+    """
+    def __init__(self, extractors):
+        self.extractors = extractors
+        self.batched = [ k for k in extractors if batched(extractors[k]) ]
+        self.other = [ k for k in extractors if not batched(extractors[k]) ]
+
+    def batch(self, ts, lo, hi):
+        """Return the dictionary of the arrays of the values of the batched
+        extractors for the windows of the `Timeseries`
+        """
+        a = _Arrays(ts.ts, ts.value)
+        memo = {}
+        return { k: self._evaluate(self.extractors[k], a, lo, hi, memo) for k in self.batched }
+
+    def _evaluate(self, e, a, lo, hi, memo):
+        key = _signature(e)
+        try:
+            return memo[key]
+        except KeyError:
+            pass
+        if isinstance(e, Scale):
+            r = e.scale * self._evaluate(e.ext, a, lo, hi, memo)
+        elif isinstance(e, _Batched):
+            r = e._batch(a, lo, hi)
+        else:
+            r = e.batch(a.ts, a.value, lo, hi)
+        memo[key] = r
+        return r
+
+def _subset(vectors, mask):
+    if isinstance(vectors, VectorList):
+        return vectors[mask]
+    return [ v for v, m in zip(vectors, mask) if m ]
+
+def _get(v, coord):
+    if hasattr(v, "coordinates"):
+        return v.coordinates[coord]
+    return v[coord]
 
 class Filter:
+    """A predicate over vectors.
 
+    A filter can be applied to a single vector (a `Vector` or a dictionary
+    of feature values), and evaluated for a whole `VectorList` at once with
+    `mask`, which returns the boolean array of the results. Filters are
+    combined with `&` (or `+`), `|` and `~`.
+    """
     def __call__(self, v):
         return self.filter(v)
 
     def __add__(self, x):
         return AndFilter(self, x)
 
+    def __and__(self, x):
+        return AndFilter(self, x)
+
+    def __or__(self, x):
+        return OrFilter(self, x)
+
+    def __invert__(self):
+        return NotFilter(self)
+
+    def mask(self, vectors):
+        return np.fromiter((bool(self.filter(v)) for v in vectors), bool, len(vectors))
+
+class _Predicate(Filter):
+    """A filter calling a plain predicate function for every vector
+    """
+    def __init__(self, f):
+        self.f = f
+
+    def filter(self, v):
+        return self.f(v)
+
+def _filter(f):
+    return f if isinstance(f, Filter) else _Predicate(f)
+
 class AndFilter(Filter):
 
     def __init__(self, a, b):
-        self.a = a
-        self.b = b
+        self.a = _filter(a)
+        self.b = _filter(b)
+
+    def filter(self, v):
+        return self.a(v) and self.b(v)
+
+    def mask(self, vectors):
+        m = self.a.mask(vectors)
+        if m.all():
+            return self.b.mask(vectors)
+        if m.any():
+            m[m] = self.b.mask(_subset(vectors, m))
+        return m
+
+class OrFilter(Filter):
+
+    def __init__(self, a, b):
+        self.a = _filter(a)
+        self.b = _filter(b)
 
     def filter(self, v):
-        return a(v) and b(v)
+        return self.a(v) or self.b(v)
+
+    def mask(self, vectors):
+        m = self.a.mask(vectors)
+        if not m.any():
+            return self.b.mask(vectors)
+        if not m.all():
+            rest = ~m
+            m[rest] = self.b.mask(_subset(vectors, rest))
+        return m
+
+class NotFilter(Filter):
+
+    def __init__(self, a):
+        self.a = _filter(a)
+
+    def filter(self, v):
+        return not self.a(v)
+
+    def mask(self, vectors):
+        return ~self.a.mask(vectors)
 
 class HasCoord(Filter):
 
@@ -37,7 +246,68 @@ class HasCoord(Filter):
         self.coord = coord
 
     def filter(self, v):
-        return self.coord in v.coordinates
+        if hasattr(v, "coordinates"):
+            return self.coord in v.coordinates
+        return self.coord in v
+
+    def mask(self, vectors):
+        if not isinstance(vectors, VectorList):
+            return Filter.mask(self, vectors)
+        return vectors.present(self.coord)
+
+class Compare(Filter):
+    """Comparison of a coordinate with a value or with another coordinate
+    (see `Coord`)
+    """
+    def __init__(self, coord, op, value):
+        self.coord = coord
+        self.op = op
+        self.value = value
+
+    def filter(self, v):
+        # A comparison involving a missing coordinate is false
+        try:
+            value = _get(v, self.value.name) if isinstance(self.value, Coord) else self.value
+            return self.op(_get(v, self.coord), value)
+        except KeyError:
+            return False
+
+    def mask(self, vectors):
+        if not isinstance(vectors, VectorList):
+            return Filter.mask(self, vectors)
+        present = vectors.present(self.coord)
+        if isinstance(self.value, Coord):
+            present &= vectors.present(self.value.name)
+        if not present.any():
+            return present
+        value = vectors[self.value.name] if isinstance(self.value, Coord) else self.value
+        with np.errstate(invalid="ignore"):
+            return np.asarray(self.op(vectors[self.coord], value), dtype=bool) & present
+
+class Coord:
+    """Reference to a coordinate for building comparison filters, e.g.
+    `Coord("scaled_sum") != 0` or `Coord("a") > Coord("b")`
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, x):
+        return Compare(self.name, operator.eq, x)
+
+    def __ne__(self, x):
+        return Compare(self.name, operator.ne, x)
+
+    def __lt__(self, x):
+        return Compare(self.name, operator.lt, x)
+
+    def __le__(self, x):
+        return Compare(self.name, operator.le, x)
+
+    def __gt__(self, x):
+        return Compare(self.name, operator.gt, x)
+
+    def __ge__(self, x):
+        return Compare(self.name, operator.ge, x)
 
 class ModelHelper:
 
@@ -53,17 +323,33 @@ class TimeseriesFeatureExtractor:
         self.coord = coord
 
     def __call__(self, src):
-        ts = sorted(src.timeseries(self.coord), key=lambda x: x.ts)
+        ts = sort_timeseries(src.timeseries(self.coord))
+        lo, hi = self.windows(ts)
+        for p, q in zip(lo.tolist(), hi.tolist()):
+            yield self.extract(ts[p:q])
+
+    def windows(self, ts):
+        """Return the arrays of the `lo` and `hi` index boundaries of the
+        windows in the sorted timeseries, starting from the most recent window
+        """
         l = len(ts)
-        if l > 0:
-            end = ts[-1].ts + 1
-            start = ts[0].ts
-            S = (end - start - self.window) // self.step + 1
-            for i in xrange(0, S):
-                q = end - i*self.step
-                p = end - i*self.step - self.window
-                sub = [ v for v in ts if v.ts >= p and v.ts < q ]
-                yield self.extract(sub)
+        if l == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        t = timestamps(ts)
+        end = int(t[-1]) + 1
+        start = int(t[0])
+        S = max(0, (end - start - self.window) // self.step + 1)
+        if isinstance(ts, Timeseries):
+            q = end - np.arange(S, dtype=np.int64) * self.step
+            return np.searchsorted(t, q - self.window), np.searchsorted(t, q)
+        lo = []
+        hi = []
+        for i in xrange(0, S):
+            q = end - i*self.step
+            p = q - self.window
+            lo.append(bisect_left(t, p))
+            hi.append(bisect_left(t, q))
+        return np.array(lo, dtype=np.int64), np.array(hi, dtype=np.int64)
 
 class TimeseriesFeatureCoordinateExtractor(TimeseriesFeatureExtractor):
 
@@ -71,12 +357,42 @@ class TimeseriesFeatureCoordinateExtractor(TimeseriesFeatureExtractor):
         TimeseriesFeatureExtractor.__init__(self, window, step, coord)
         self.coordExtractor = coordExtractor
 
+    def __call__(self, src):
+        if _overrides(self, TimeseriesFeatureCoordinateExtractor, "extract"):
+            return TimeseriesFeatureExtractor.__call__(self, src)
+        n, values = self._columns(src)
+        return _rows(n, values)
+
+    def columns(self):
+        """Return the list of the output coordinates
+        """
+        return list(self.coordExtractor)
+
+    def _columns(self, src):
+        """Return the number of windows and the dictionary of the sequences
+        of the output coordinate values, one value for every window
+        """
+        ts = sort_timeseries(src.timeseries(self.coord))
+        lo, hi = self.windows(ts)
+        plan = _ExtractionPlan(self.coordExtractor)
+        values = plan.batch(as_timeseries(ts), lo, hi) if plan.batched else {}
+        if plan.other:
+            subs = [ ts[p:q] for p, q in zip(lo.tolist(), hi.tolist()) ]
+            for k in plan.other:
+                values[k] = [ self.coordExtractor[k](sub) for sub in subs ]
+        return len(lo), values
+
     def extract(self, sub):
         return { k:self.coordExtractor[k](sub) for k in self.coordExtractor }
 
-class OnTimeExtractor:
+class OnTimeExtractor(_Batched):
 
     def __call__(self, sub):
+        if isinstance(sub, Timeseries):
+            if len(sub) < 2:
+                return 0
+            on = (sub.value > 0).astype(np.int64)
+            return int(((on[:-1] + on[1:]) // 2 * np.diff(sub.ts)).sum())
         s = 0
         for i in xrange(len(sub)-1):
             v1 = 1 if sub[i].value > 0 else 0
@@ -85,9 +401,16 @@ class OnTimeExtractor:
             s += (v1+v2)/2 * t
         return s
 
-class StopsExtractor:
+    def _batch(self, a, lo, hi):
+        on = a.on
+        return _pair_sums(a.get("ontime", lambda a: _prefix((on[:-1] + on[1:]) // 2 * np.diff(a.ts))), lo, hi)
+
+class StopsExtractor(_Batched):
 
     def __call__(self, sub):
+        if isinstance(sub, Timeseries):
+            on = sub.value > 0
+            return int((on[:-1] & ~on[1:]).sum())
         s = 0
         for i in xrange(len(sub)-1):
             v1 = 1 if sub[i].value > 0 else 0
@@ -96,6 +419,10 @@ class StopsExtractor:
                 s += 1
         return s
 
+    def _batch(self, a, lo, hi):
+        on = a.on
+        return _pair_sums(a.get("stops", lambda a: _prefix(on[:-1] & (1 - on[1:]))), lo, hi)
+
 class Scale:
         
     def __init__(self, scale, ext):
@@ -104,15 +431,158 @@ class Scale:
         
     def __call__(self, sub):
         return self.scale * self.ext(sub)
+
+    def batch(self, ts, value, lo, hi):
+        return self.scale * self.ext.batch(ts, value, lo, hi)
         
-class Sum:
+class Sum(_Batched):
     
     def __call__(self, sub):
+        if isinstance(sub, Timeseries):
+            return float(sub.value.sum())
         s = 0
         for d in sub:
             s += d.value
         return s
+
+    def _batch(self, a, lo, hi):
+        c = a.cumsum
+        return c[hi] - c[lo]
     
+def _values(sub):
+    if isinstance(sub, Timeseries):
+        return sub.value
+    return np.fromiter((d.value for d in sub), np.float64, len(sub))
+
+def _window_order(lo, hi):
+    """Return the order in which to visit the windows so that both of their
+    boundaries only move forward, or `None` if there is no such order
+    """
+    if len(lo) < 2:
+        return xrange(len(lo))
+    dlo = np.diff(lo)
+    dhi = np.diff(hi)
+    if (dlo >= 0).all() and (dhi >= 0).all():
+        return xrange(len(lo))
+    if (dlo <= 0).all() and (dhi <= 0).all():
+        return xrange(len(lo) - 1, -1, -1)
+    return None
+
+class Count(_Batched):
+
+    def __call__(self, sub):
+        return len(sub)
+
+    def _batch(self, a, lo, hi):
+        return hi - lo
+
+class Mean(_Batched):
+
+    def __call__(self, sub):
+        v = _values(sub)
+        return float(v.mean()) if len(v) > 0 else float("nan")
+
+    def _batch(self, a, lo, hi):
+        c = a.cumsum
+        n = hi - lo
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(n > 0, (c[hi] - c[lo]) / np.maximum(n, 1), np.nan)
+
+class Variance(_Batched):
+    """Population variance of the values in the window. For overlapping
+    windows it is updated incrementally as points enter and leave the window.
+    """
+    def __call__(self, sub):
+        v = _values(sub)
+        return float(v.var()) if len(v) > 0 else float("nan")
+
+    def _batch(self, a, lo, hi):
+        order = _window_order(lo, hi)
+        if order is None:
+            return np.array([ self(Timeseries(a.ts[p:q], a.value[p:q])) for p, q in zip(lo, hi) ])
+        value = a.value.tolist()
+        lo = lo.tolist()
+        hi = hi.tolist()
+        result = np.empty(len(lo))
+        n = 0
+        mean = 0.0
+        m2 = 0.0
+        # The points in [p, q) are the ones currently in the window
+        p = q = 0
+        for w in order:
+            if lo[w] >= q:
+                n = 0
+                mean = 0.0
+                m2 = 0.0
+                p = q = lo[w]
+            while q < hi[w]:
+                x = value[q]
+                n += 1
+                d = x - mean
+                mean += d / n
+                m2 += d * (x - mean)
+                q += 1
+            while p < lo[w]:
+                x = value[p]
+                n -= 1
+                if n == 0:
+                    mean = 0.0
+                    m2 = 0.0
+                else:
+                    d = x - mean
+                    mean -= d / n
+                    m2 -= d * (x - mean)
+                p += 1
+            result[w] = max(m2, 0.0) / n if n > 0 else np.nan
+        return result
+
+class _Extreme(_Batched):
+
+    def __call__(self, sub):
+        v = _values(sub)
+        return float(self.reduce(v)) if len(v) > 0 else float("nan")
+
+    def _batch(self, a, lo, hi):
+        order = _window_order(lo, hi)
+        if order is None:
+            return np.array([ self(Timeseries(a.ts[p:q], a.value[p:q])) for p, q in zip(lo, hi) ])
+        value = a.value.tolist()
+        lo = lo.tolist()
+        hi = hi.tolist()
+        result = np.empty(len(lo))
+        dominates = self.dominates
+        # Indices of the candidate extremes, their values are monotonic
+        candidates = deque()
+        q = 0
+        for w in order:
+            q = max(q, lo[w])
+            while q < hi[w]:
+                x = value[q]
+                while candidates and dominates(x, value[candidates[-1]]):
+                    candidates.pop()
+                candidates.append(q)
+                q += 1
+            while candidates and candidates[0] < lo[w]:
+                candidates.popleft()
+            result[w] = value[candidates[0]] if candidates else np.nan
+        return result
+
+class Min(_Extreme):
+    """Minimum of the values in the window. For overlapping windows it is
+    maintained over a monotonic deque of candidates.
+    """
+    reduce = staticmethod(np.min)
+    dominates = staticmethod(lambda x, y: x <= y)
+
+class Max(_Extreme):
+    """Maximum of the values in the window. For overlapping windows it is
+    maintained over a monotonic deque of candidates.
+    """
+    reduce = staticmethod(np.max)
+    dominates = staticmethod(lambda x, y: x >= y)
+
+_STATELESS = (OnTimeExtractor, StopsExtractor, Sum, Count, Mean, Variance, Min, Max)
+
 class TimeseriesCollectionFeatureExtractor:
     
     def __init__(self, _from, _to, window, step, coords):
@@ -126,13 +596,13 @@ class TimeseriesCollectionFeatureExtractor:
         end = self._to
         start = self._from
         S = (end - start) // self.step
+        if S <= 0:
+            return
+        buckets = { c: split_timeseries(src.timeseries(c), start, self.step, S) for c in self.coords }
         for i in xrange(0, S):
-            q = start + (i+1) * self.step
-            p = start + i * self.step
             r = {}
             for c in self.coords:
-                sub = [ v for v in src.timeseries(c) if v.ts >= p and v.ts < q ]
-                m = self.extract(c, sub)
+                m = self.extract(c, buckets[c][i])
                 for k, v in m.iteritems():
                     if k in r:
                         raise ValueError("Coordinate %s has already been set" % k)
@@ -145,9 +615,66 @@ class TimeseriesCollectionFeatureCoordinateExtractor(TimeseriesCollectionFeature
         TimeseriesCollectionFeatureExtractor.__init__(self, _from, _to, window, step, list(coordExtractor.keys()))
         self.coordExtractor = coordExtractor
 
+    def __call__(self, src):
+        if _overrides(self, TimeseriesCollectionFeatureCoordinateExtractor, "extract"):
+            return TimeseriesCollectionFeatureExtractor.__call__(self, src)
+        n, values = self._columns(src)
+        return _rows(n, values)
+
+    def columns(self):
+        """Return the list of the output coordinates
+        """
+        return [ k for c in self.coords for k in self.coordExtractor[c] ]
+
+    def _columns(self, src):
+        """Return the number of windows and the dictionary of the sequences
+        of the output coordinate values, one value for every window
+        """
+        end = self._to
+        start = self._from
+        S = (end - start) // self.step
+        if S <= 0:
+            return 0, { k: np.empty(0) for c in self.coords for k in self.coordExtractor[c] }
+        values = {}
+        for c in self.coords:
+            extractors = self.coordExtractor[c]
+            for k in extractors:
+                if k in values:
+                    raise ValueError("Coordinate %s has already been set" % k)
+                values[k] = None
+            ts = src.timeseries(c)
+            plan = _ExtractionPlan(extractors)
+            if plan.batched:
+                a, lo, hi = as_timeseries(ts).buckets(start, self.step, S)
+                values.update(plan.batch(a, lo, hi))
+            if plan.other:
+                buckets = split_timeseries(ts, start, self.step, S)
+                for k in plan.other:
+                    values[k] = [ extractors[k](b) for b in buckets ]
+        return S, values
+
     def extract(self, coord, sub):
         return { k: self.coordExtractor[coord][k](sub) for k in self.coordExtractor[coord] }
 
+def _overrides(obj, base, name):
+    """Whether the class of `obj` replaces the method of `base`
+    """
+    return getattr(obj.__class__, name).im_func is not getattr(base, name).im_func
+
+def _columnar(extractor):
+    """Whether the output of the extractor can be obtained from its
+    `_columns`, i.e. neither `__call__` nor `extract` is overridden
+    """
+    for base in (TimeseriesFeatureCoordinateExtractor, TimeseriesCollectionFeatureCoordinateExtractor):
+        if isinstance(extractor, base):
+            return not (_overrides(extractor, base, "__call__") or _overrides(extractor, base, "extract"))
+    return False
+
+def _rows(n, values):
+    values = [ (k, v.tolist() if isinstance(v, np.ndarray) else v) for k, v in values.iteritems() ]
+    for i in xrange(n):
+        yield { k: v[i] for k, v in values }
+
 class Extract:
 
     def __init__(self, extractor):
@@ -158,6 +685,104 @@ class Extract:
             for x in self.extractor(v):
                 yield x
 
+class FeatureMatrix:
+    """A feature matrix that the extracted feature vectors are written into
+    directly, without keeping the intermediate dictionaries.
+
+    The rows are stored in a preallocated float array which grows
+    geometrically as rows are added. Every column corresponds to a
+    coordinate of the feature vectors, optionally followed by the label
+    column (as expected by `KMeansModelFactory.run`).
+
+    Attributes:
+        columns     The list of the coordinate names in the column order
+        label       The default label of the rows, or `None` if the matrix
+                    has no label column
+    """
+    def __init__(self, columns, label=None, capacity=1024):
+        """Construct a FeatureMatrix object.
+
+        Arguments:
+            columns     The list of the coordinate names, or a feature
+                        extractor (e.g. `TimeseriesCollectionFeatureCoordinateExtractor`)
+                        in which case its output coordinates are used in the
+                        order of its `coordExtractor`
+            label       If not `None`, the matrix gets the label column with
+                        this value as the default label
+            capacity    The initial number of rows to allocate
+        """
+        if hasattr(columns, "columns"):
+            columns = columns.columns()
+        self.columns = list(columns)
+        self.index = { c: i for i, c in enumerate(self.columns) }
+        self.label = label
+        width = len(self.columns) + (0 if label is None else 1)
+        self.data = np.zeros((max(1, capacity), width))
+        self.rows = 0
+
+    def __len__(self):
+        return self.rows
+
+    def _reserve(self, n):
+        if self.rows + n > self.data.shape[0]:
+            data = np.zeros((max(self.rows + n, 2 * self.data.shape[0]), self.data.shape[1]))
+            data[:self.rows] = self.data[:self.rows]
+            self.data = data
+
+    def _label(self, label):
+        if label is None:
+            return self.label
+        if self.label is None:
+            raise ValueError("The matrix has no label column")
+        return label
+
+    def append(self, vector, label=None):
+        """Add the feature vector (a dictionary of coordinate values) as a row
+        """
+        label = self._label(label)
+        self._reserve(1)
+        row = self.data[self.rows]
+        for c, j in self.index.iteritems():
+            row[j] = vector[c]
+        if label is not None:
+            row[-1] = label
+        self.rows += 1
+
+    def extend(self, vectors, label=None):
+        for v in vectors:
+            self.append(v, label)
+
+    def extract(self, extractor, vectors, label=None):
+        """Apply the feature extractor to every one of the vectors and add
+        the obtained feature vectors as rows. The extractors providing the
+        columns of feature values (such as `TimeseriesFeatureCoordinateExtractor`)
+        write them in bulk.
+        """
+        label = self._label(label)
+        for v in vectors:
+            if not _columnar(extractor):
+                self.extend(extractor(v), label)
+                continue
+            n, values = extractor._columns(v)
+            if n == 0:
+                continue
+            self._reserve(n)
+            block = self.data[self.rows:self.rows+n]
+            for c, j in self.index.iteritems():
+                block[:, j] = values[c]
+            if label is not None:
+                block[:, -1] = label
+            self.rows += n
+
+    def array(self):
+        """Return the filled part of the matrix as an array (a view, not a
+        copy)
+        """
+        return self.data[:self.rows]
+
+    def matrix(self):
+        return np.mat(self.array())
+
 class Progress:
 
     def __init__(self, label=""):
@@ -167,11 +792,35 @@ class Progress:
         if n % 10 == 0 or n == total:
             print "%s%d/%d" % ("%s " % self.label if self.label else "", n, total)
 
+class _Repeat(object):
+
+    def __init__(self, value):
+        self.value = value
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self.value
+
+    __next__ = next
+
 def diag_vect(v):
-    while True:
-        yield v
-        
-def matrix(*argv):
+    """Return an infinite iterator repeating `v`, to be used as a constant
+    column of `matrix`
+    """
+    return _Repeat(v)
+
+def matrix(*argv, **kwargs):
+    """Assemble a matrix from the column vectors. Columns shorter than the
+    longest one are padded with zeros, columns without length (such as
+    `diag_vect`) are consumed up to the length of the longest one. Returns a
+    `numpy.matrix` unless `asarray=True` is given, in which case a plain
+    array is returned.
+    """
+    asarray = kwargs.pop("asarray", False)
+    if kwargs:
+        raise TypeError("Unexpected keyword arguments: %s" % ", ".join(kwargs))
     N = 0 # cols
     M = -1 # rows
     for v in argv:
@@ -186,21 +835,29 @@ def matrix(*argv):
         raise ValueError("Cannot determine matrix dimensions")
     arr = np.zeros((M, N))
     for j, v in enumerate(argv):
-        p = 0
+        if isinstance(v, _Repeat):
+            arr[:, j] = v.value
+            continue
         try:
-            l = len(v)
+            len(v)
         except TypeError:
-            for i in xrange(M):
-                arr[i, j] = next(v, 0)
+            arr[:, j] = np.fromiter(islice(chain(v, repeat(0)), M), np.float64, M)
             continue
-        for i in xrange(len(v)):
-            arr[i, j] = v[i]
-            p += 1  
-    return np.mat(arr)
-
-def stack(*argv):
+        a = np.asarray(v, dtype=np.float64).ravel()
+        arr[:len(a), j] = a
+    return arr if asarray else np.mat(arr)
+
+def stack(*argv, **kwargs):
+    """Stack the matrices (which must have the same number of columns) on
+    top of each other. Returns a `numpy.matrix` unless `asarray=True` is
+    given, in which case a plain array is returned.
+    """
+    asarray = kwargs.pop("asarray", False)
+    if kwargs:
+        raise TypeError("Unexpected keyword arguments: %s" % ", ".join(kwargs))
+    if len(argv) == 0:
+        raise ValueError("No matrices provided")
     N = -1
-    M = 0
     for v in argv:
         if len(v.shape) != 2:
             raise ValueError
@@ -209,27 +866,104 @@ def stack(*argv):
         else:
             if N != v.shape[1]:
                 raise ValueError("All matrices must have the same number of columns")
-        M += v.shape[0]
-    arr = np.zeros((M, N))
-    i = 0
-    for v in argv:
-        for k in xrange(v.shape[0]):
-            for j in xrange(N):
-                arr[i, j] = v[k, j]
-            i += 1
-    return np.mat(arr)
-            
+    arr = np.concatenate([ np.asarray(v, dtype=np.float64) for v in argv ], axis=0)
+    return arr if asarray else np.mat(arr)
+
+def _readonly(a):
+    a.flags.writeable = False
+    return a
+
 class VectorList:
-    
+    """A list of feature vectors (dictionaries of coordinate values) stored
+    as named columns.
+
+    The columns are built once from the input vectors. Indexing a
+    VectorList with a coordinate name returns the column as a read-only
+    array (not a copy), indexing it with a boolean mask returns a new VectorList with the
+    selected vectors; its columns are only extracted when they are accessed.
+    Coordinates missing in some of the vectors are NaN in the columns (see
+    `present` for telling them from NaN values), while iterating yields the
+    input vectors themselves.
+    """
     def __init__(self, values):
-        self.values = list(values)
-        
+        self._index = None
+        self._cache = {}
+        if isinstance(values, VectorList):
+            self._columns = values._columns
+            self._present = values._present
+            self._rows = values._rows
+            self._index = values._index
+            self._values = values._values
+            self._len = len(values)
+            return
+        values = list(values)
+        self._columns = {}
+        self._present = {}
+        for k in set().union(*values):
+            try:
+                c = [ v[k] for v in values ]
+            except KeyError:
+                c = [ v.get(k, np.nan) for v in values ]
+                self._present[k] = np.fromiter((k in v for v in values), bool, len(values))
+            self._columns[k] = _readonly(np.asarray(c))
+        self._rows = values
+        self._values = values
+        self._len = len(values)
+
     def __getitem__(self, key):
-        return [ v[key] for v in self.values ]
-    
+        if isinstance(key, (np.ndarray, list)):
+            return self._select(key)
+        if self._index is None:
+            return self._columns[key]
+        try:
+            return self._cache[key]
+        except KeyError:
+            self._cache[key] = _readonly(self._columns[key][self._index])
+            return self._cache[key]
+
+    def _select(self, mask):
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != (len(self),):
+            raise ValueError("Mask length %d does not match the number of vectors %d" % (mask.size, len(self)))
+        index = np.flatnonzero(mask)
+        result = VectorList([])
+        result._columns = self._columns
+        result._present = self._present
+        result._rows = self._rows
+        result._index = index if self._index is None else self._index[index]
+        result._values = None
+        result._len = len(index)
+        return result
+
+    def columns(self):
+        """Return the list of the coordinate names
+        """
+        return list(self._columns)
+
+    def present(self, key):
+        """Return the boolean array telling which vectors have the coordinate
+        """
+        if key not in self._columns:
+            return np.zeros(len(self), dtype=bool)
+        present = self._present.get(key)
+        if present is None:
+            return np.ones(len(self), dtype=bool)
+        return present.copy() if self._index is None else present[self._index]
+
+    def filter(self, f):
+        """Return a new VectorList with the vectors satisfying the filter (a
+        `Filter` or a function of a single vector)
+        """
+        return self[_filter(f).mask(self)]
+
+    @property
+    def values(self):
+        if self._values is None:
+            self._values = [ self._rows[i] for i in self._index.tolist() ]
+        return self._values
+
     def __len__(self):
-        return len(self.values)
-    
+        return self._len
+
     def __iter__(self):
-        return self.values.__iter__()
-            
\ No newline at end of file
+        return iter(self.values)
@@ -11,12 +11,34 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from operator import itemgetter
+
 keydefs = {}
 
+def _str(s):
+    if type(s) == unicode:
+        return s.encode("utf-8")
+    return str(s)
+
 class KeyDef:
 
     def __init__(self, keydef):
         self.d = KeyDef.parse_def(keydef)
+        self.compile()
+
+    def compile(self):
+        """Precompute the format string (with a `%s` slot in place of every
+        parameter) and the parameter names used by `apply()` and `render()`
+        """
+        self.format = "%s".join([_str(s).replace("%", "%%") for s in self.d[::2]])
+        self.names = tuple(self.d[1::2])
+        if len(self.names) > 1:
+            self.values = itemgetter(*self.names)
+        elif self.names:
+            name = self.names[0]
+            self.values = lambda ctx: (ctx[name],)
+        else:
+            self.values = lambda ctx: ()
 
     @staticmethod
     def parse_def(d):
@@ -46,18 +68,16 @@ class KeyDef:
             return keydefs[d]
 
     def apply(self, r):
-        result = ""
-        for i in range(len(self.d)):
-            if i % 2 == 0:
-                s = self.d[i]
-            else:
-                s = r(self.d[i])
-            if type(s) == unicode:
-                s = s.encode("utf-8")
-            else:
-                s = str(s)
-            result += s
-        return result
+        return self.format % tuple([_str(r(n)) for n in self.names])
+
+    def render(self, ctx):
+        return self.format % tuple([s if type(s) is str else _str(s) for s in self.values(ctx)])
+
+    def render_many(self, contexts):
+        format = self.format
+        values = self.values
+        return [format % tuple([s if type(s) is str else _str(s) for s in values(ctx)])
+                for ctx in contexts]
 
     def getUnboundVars(self):
         res = []
@@ -74,4 +94,15 @@ class Template:
         #print "TEMPLATE %s" % self.keyDef.getUnboundVars()
 
     def __call__(self, ctx):
-        return self.keyDef.apply(lambda k: ctx[k])
\ No newline at end of file
+        return self.keyDef.render(ctx)
+
+    def render_many(self, contexts):
+        """Render the template for every context in `contexts` and return
+        the list of results
+        """
+        return self.keyDef.render_many(contexts)
+
+    def fields(self):
+        """Return the names of the context values used by the template
+        """
+        return self.keyDef.getUnboundVars()
\ No newline at end of file